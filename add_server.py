@@ -1,62 +1,220 @@
-import json
+import mmap
 import os
+import re
+import threading
 
-def add_mcp_server_to_config(new_server_data, config_path="sse_servers.json"):
+import json_compat
+
+# Append-only config: a header line, then one JSON server entry per line
+CONFIG_PATH = "servers.jsonl"
+CONFIG_HEADER = {"version": 1}
+# Rewrite the config without superseded entries once it grows past this many lines
+COMPACT_THRESHOLD = 200
+
+# Commands that identify a stdio server type
+_KINDS = {"npx", "uv"}
+# 'npx'/'uv' as a standalone word or path component in the args, but not e.g. 'npxfoo'
+_ARGS_RE = re.compile(r"(?:^|[\s/\\])(npx|uv)(?:$|[\s@])")
+# Whitespace-only config lines, matched in place against the mmap
+_BLANK_LINE_RE = re.compile(rb"\s*")
+
+# Config files used before servers.jsonl existed; None means entries carry their own transport
+LEGACY_CONFIGS = {
+    "servers.json": None,
+    "sse_servers.json": "sse",
+    "npx_servers.json": "npx",
+    "uv_servers.json": "uv",
+}
+
+
+class AtomicWriter:
+    """Replace a file atomically, coalescing overlapping writes to the same path"""
+    _writers = {}
+    _writers_lock = threading.Lock()
+
+    def __new__(cls, path):
+        # One writer per path so concurrent callers share the pending slot
+        key = os.path.abspath(path)
+        with cls._writers_lock:
+            writer = cls._writers.get(key)
+            if writer is None:
+                writer = super().__new__(cls)
+                writer.path = key
+                writer._lock = threading.Lock()
+                writer._pending = None
+                writer._flushing = False
+                cls._writers[key] = writer
+        return writer
+
+    def write(self, data: bytes):
+        """Queue data for the file; only the latest payload is guaranteed to hit disk"""
+        with self._lock:
+            self._pending = data
+            if self._flushing:
+                # The active flush picks up the newest payload when it finishes
+                return
+            self._flushing = True
+        try:
+            self._flush()
+        except BaseException:
+            with self._lock:
+                self._flushing = False
+            raise
+
+    def _flush(self):
+        tmp_path = self.path + ".tmp"
+        while True:
+            with self._lock:
+                data = self._pending
+                self._pending = None
+                if data is None:
+                    self._flushing = False
+                    return
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+def make_entry(server_name, server_info, transport=None):
+    """Build a config line entry for one server, detecting its transport if not given"""
+    config = {key: value for key, value in server_info.items() if key != "transport"}
+    transport = (
+        transport
+        or server_info.get("transport")
+        or check_server_type({"mcpServers": {server_name: config}})
+        or "sse"
+    )
+    return {"name": server_name, "transport": transport, "config": config}
+
+def is_header(entry):
+    """Whether a parsed config line is the header rather than a server entry"""
+    return isinstance(entry, dict) and "name" not in entry and "version" in entry
+
+def is_server_entry(entry):
+    """Whether a parsed config line has the {"name", "transport", "config"} shape"""
+    return (
+        isinstance(entry, dict)
+        and isinstance(entry.get("name"), str)
+        and isinstance(entry.get("transport"), str)
+        and isinstance(entry.get("config"), dict)
+    )
+
+def _write_entries(config_path, entries):
+    """Atomically replace config_path with a header followed by the given entries"""
+    lines = [json_compat.dumps(CONFIG_HEADER)]
+    lines.extend(json_compat.dumps(entry) for entry in entries)
+    AtomicWriter(config_path).write(b"\n".join(lines) + b"\n")
+
+def add_mcp_server_to_config(new_server_data, config_path=CONFIG_PATH):
+    entries = [
+        make_entry(server_name, server_info)
+        for server_name, server_info in new_server_data["mcpServers"].items()
+    ]
     # Check if config file exists
     if os.path.exists(config_path):
         try:
-            # Read existing config
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-            
-            # Ensure mcpServers key exists
-            if "mcpServers" not in config:
-                config["mcpServers"] = {}
-            
-            # Add the new server to mcpServers
-            for server_name, server_info in new_server_data["mcpServers"].items():
-                config["mcpServers"][server_name] = server_info
-                
-            # Write updated config back to file
-            with open(config_path, 'w') as f:
-                json.dump(config, f, indent=2)
-                
+            # Append the new entries; a later line for the same name replaces earlier ones
+            with open(config_path, 'ab+') as f:
+                # A hand-edited file may lack a trailing newline; don't glue the entry onto its last line
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                for entry in entries:
+                    f.write(json_compat.dumps(entry) + b"\n")
+
             print(f"Successfully added server(s) to {config_path}")
-            
-        except json.JSONDecodeError:
-            print(f"Error: {config_path} contains invalid JSON")
+
         except Exception as e:
             print(f"Error updating config: {str(e)}")
     else:
         # Create new config file with the server
-        with open(config_path, 'w') as f:
-            json.dump(new_server_data, f, indent=2)
+        _write_entries(config_path, entries)
             
         print(f"Created new {config_path} with server configuration")
 
+def _read_entries(config_path):
+    """Map each server name to its latest entry, parsing lines straight out of an mmap"""
+    entries = {}
+    with open(config_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return entries
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            start = 0
+            line_number = 0
+            while start < len(mm):
+                line_number += 1
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    end = len(mm)
+                if not _BLANK_LINE_RE.fullmatch(mm, start, end):
+                    try:
+                        with view[start:end] as line:
+                            entry = json_compat.loads(line)
+                    except json_compat.JSONDecodeError:
+                        entry = None
+                    if is_server_entry(entry):
+                        entries[entry["name"]] = entry
+                    elif not is_header(entry):
+                        print(f"Error parsing line {line_number} of {config_path}, skipping it.")
+                start = end + 1
+    return entries
+
+def compact(config_path=CONFIG_PATH):
+    """Rewrite config_path keeping only the latest entry for each server name"""
+    _write_entries(config_path, _read_entries(config_path).values())
+
+def migrate_legacy_configs(config_path=CONFIG_PATH):
+    """Merge the legacy config files into config_path, once"""
+    if os.path.exists(config_path):
+        return
+
+    entries = {}
+    failed = []
+    for legacy_path, transport in LEGACY_CONFIGS.items():
+        # Only merge a file once it has parsed completely; ijson yields entries before it hits an error
+        file_entries = {}
+        try:
+            for server_name, server_info in json_compat.iter_servers(legacy_path):
+                file_entries[server_name] = make_entry(server_name, server_info, transport)
+        except FileNotFoundError:
+            continue
+        except json_compat.JSONDecodeError:
+            print(f"Error: {legacy_path} contains invalid JSON")
+            failed.append(legacy_path)
+            continue
+        entries.update(file_entries)
+
+    if failed:
+        # Writing config_path now would stop the migration from ever running again
+        print(f"Not migrating into {config_path} until {', '.join(failed)} is fixed")
+        return
+
+    if entries:
+        _write_entries(config_path, entries.values())
+        print(f"Migrated legacy config files into {config_path}")
+
+def _iter_kinds(server_data):
+    """Yield the 'npx'/'uv' kind of each server in turn, stopping at the first detected one"""
+    for server_info in server_data.get("mcpServers", {}).values():
+        # Check if 'npx' or 'uv' is the command
+        command = server_info.get("command")
+        if command in _KINDS:
+            yield command
+            return
+        
+        # Check if 'npx' or 'uv' appears in the args
+        match = _ARGS_RE.search(" ".join(map(str, server_info.get("args", []))))
+        if match:
+            yield match.group(1)
+            return
+
 def check_server_type(server_data):
     """Check if 'npx' or 'uv' is present in the server configuration"""
-    if "mcpServers" not in server_data:
-        return None
-    
-    for server_name, server_info in server_data["mcpServers"].items():
-        # Check if 'npx' or 'uv' is in command
-        command = server_info.get("command", "")
-        if command == "npx":
-            return "npx"
-        elif command == "uv":
-            return "uv"
-        
-        # Check if 'npx' or 'uv' is in any of the args
-        args = server_info.get("args", [])
-        for arg in args:
-            arg_str = str(arg)
-            if "npx" in arg_str:
-                return "npx"
-            elif "uv" in arg_str:
-                return "uv"
-    
-    return None
+    return next(_iter_kinds(server_data), None)
 
 if __name__ == "__main__":
     # New server configuration to add
@@ -75,11 +233,5 @@ if __name__ == "__main__":
   }
 }
 }
-    # Check server type and add to appropriate config file
-    server_type = check_server_type(new_server)
-    if server_type == "npx":
-        add_mcp_server_to_config(new_server, "npx_servers.json")
-    elif server_type == "uv":
-        add_mcp_server_to_config(new_server, "uv_servers.json")
-    else:
-        add_mcp_server_to_config(new_server)
+    # The server type is detected per server and stored as its transport
+    add_mcp_server_to_config(new_server)
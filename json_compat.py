@@ -0,0 +1,46 @@
+"""Thin JSON shim: uses orjson/ijson when installed, falls back to the stdlib json module."""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - ijson is optional
+    ijson = None
+
+JSONDecodeError = (json.JSONDecodeError,)
+if orjson is not None:
+    JSONDecodeError += (orjson.JSONDecodeError,)
+if ijson is not None:
+    JSONDecodeError += (ijson.JSONError,)
+
+
+def loads(data):
+    """Parse JSON from bytes, memoryview or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """Serialize obj to compact UTF-8 encoded JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def iter_servers(path):
+    """Yield (name, server) pairs from the mcpServers object of a config file
+
+    With ijson this streams the file so only one server entry is materialized at a time.
+    """
+    with open(path, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.kvitems(f, 'mcpServers', use_float=True)
+        else:
+            yield from loads(f.read()).get('mcpServers', {}).items()
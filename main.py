@@ -1,50 +1,102 @@
 import asyncio
-import json
+import hashlib
 import os
-from typing import Optional
+import sys
+from pathlib import Path
+from typing import AsyncIterator, Optional
 from contextlib import AsyncExitStack
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
+from mcp.types import ToolListChangedNotification
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import anyio
+import msgspec
+
+import json_compat
+from add_server import (
+    COMPACT_THRESHOLD,
+    CONFIG_PATH,
+    AtomicWriter,
+    compact,
+    is_header,
+    is_server_entry,
+    migrate_legacy_configs,
+)
 
 load_dotenv()  # load environment variables from .env
 
+# Set EASYMCP_QUIET=1 to skip informational output such as the tool listing
+QUIET = os.getenv("EASYMCP_QUIET") == "1"
+
+# Tool schemas from previous runs, one file per server
+TOOLS_CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "easymcp"
+
+def _flatten_content(result) -> str:
+    """Join the text parts of a tool result line by line, falling back to str() for non-text parts"""
+    parts = result.content if hasattr(result, 'content') else [result]
+    return "\n".join(part.text if hasattr(part, 'text') else str(part) for part in parts)
+
+
+class ToolAwareClientSession(ClientSession):
+    """ClientSession that reports tools/list_changed notifications to a callback"""
+    def __init__(self, *args, on_tools_changed=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_tools_changed = on_tools_changed
+
+    async def _received_notification(self, notification):
+        if isinstance(notification.root, ToolListChangedNotification) and self._on_tools_changed:
+            self._on_tools_changed()
+        await super()._received_notification(notification)
+
+
+class Msg(msgspec.Struct, omit_defaults=True):
+    """A chat message in the shape the OpenAI API expects"""
+    role: str
+    content: Optional[str]
+    tool_call_id: Optional[str] = None
+    tool_calls: Optional[list] = None
+
+
 class MCPClient:
     def __init__(self):
         # Initialize session and client objects
         self.session: Optional[ClientSession] = None
-        self._streams_context = None
-        self._session_context = None
+        # Owns the transport and session contexts; closed by cleanup()
         self.exit_stack = AsyncExitStack()
-        self.openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Re-runs the last connect call after the connection is lost
+        self._reconnect = None
+        # OpenAI tool definitions, built once per connection
+        self._tools_cache: Optional[list] = None
+        # Where the tool definitions are persisted, and the server version they belong to
+        self._tools_cache_path: Optional[Path] = None
+        self._server_version: Optional[str] = None
+        self.openai = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o")
 
     async def connect_to_sse_server(self, server_url: str):
         """Connect to an MCP server running with SSE transport"""
-        # Store the context managers so they stay alive
-        self._streams_context = sse_client(url=server_url)
-        streams = await self._streams_context.__aenter__()
-
-        self._session_context = ClientSession(*streams)
-        self.session: ClientSession = await self._session_context.__aenter__()
+        self._reconnect = lambda: self.connect_to_sse_server(server_url)
+        streams = await self.exit_stack.enter_async_context(sse_client(url=server_url))
+        self.session = await self.exit_stack.enter_async_context(
+            ToolAwareClientSession(*streams, on_tools_changed=self._invalidate_tools)
+        )
 
         # Initialize
-        await self.session.initialize()
+        init_result = await self.session.initialize()
 
         # List available tools to verify connection
         print("Initialized SSE client...")
-        print("Listing tools...")
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\nConnected to server with tools:", [tool.name for tool in tools])
+        await self._load_tools(server_url, init_result.serverInfo.version)
+        if not QUIET:
+            sys.stdout.write("\nConnected to server with tools: " + ", ".join(tool["function"]["name"] for tool in self._tools_cache) + "\n")
 
     async def connect_to_stdio_server(self, command: str, args: list):
         """Connect to an MCP server running with STDIO transport (NPX, UV, etc.)"""
+        self._reconnect = lambda: self.connect_to_stdio_server(command, args)
         # On Windows, we need to use cmd.exe to run npx
         if os.name == 'nt' and command in ['npx', 'uv']:
             # Convert the command and args to a single command string for cmd.exe
@@ -57,155 +109,207 @@ class MCPClient:
             # For non-Windows systems or other commands
             server_params = StdioServerParameters(command=command, args=args)
         
-        # Store the context managers so they stay alive
-        self._streams_context = stdio_client(server_params)
-        streams = await self._streams_context.__aenter__()
-
-        self._session_context = ClientSession(*streams)
-        self.session: ClientSession = await self._session_context.__aenter__()
+        streams = await self.exit_stack.enter_async_context(stdio_client(server_params))
+        self.session = await self.exit_stack.enter_async_context(
+            ToolAwareClientSession(*streams, on_tools_changed=self._invalidate_tools)
+        )
 
         # Initialize
-        await self.session.initialize()
+        init_result = await self.session.initialize()
 
         # List available tools to verify connection
         print(f"Initialized {command.upper()} client...")
-        print("Listing tools...")
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\nConnected to server with tools:", [tool.name for tool in tools])
+        await self._load_tools(' '.join([command] + args), init_result.serverInfo.version)
+        if not QUIET:
+            sys.stdout.write("\nConnected to server with tools: " + ", ".join(tool["function"]["name"] for tool in self._tools_cache) + "\n")
 
-    async def cleanup(self):
-        """Properly clean up the session and streams"""
-        if self._session_context:
-            await self._session_context.__aexit__(None, None, None)
-        if self._streams_context:
-            await self._streams_context.__aexit__(None, None, None)
-
-    async def process_query(self, query: str) -> str:
-        """Process a query using OpenAI and available tools"""
-        messages = [
-            {
-                "role": "user",
-                "content": query
-            }
-        ]
+    async def _load_tools(self, server_key: str, server_version: str):
+        """Fill the tools cache from disk if it matches the server version, else from the server"""
+        digest = hashlib.blake2b(server_key.encode(), digest_size=16).hexdigest()
+        self._tools_cache_path = TOOLS_CACHE_DIR / f"{digest}.json"
+        self._server_version = server_version
 
-        # Try to get tools list, with reconnection logic if needed
         try:
-            response = await self.session.list_tools()
-        except anyio.BrokenResourceError:
-            print("Connection to server lost. Attempting to reconnect...")
-            # Get the current server details from the existing session
-            # This is a simplified reconnection - you might need to adjust based on server type
-            if hasattr(self._streams_context, 'url'):  # SSE connection
-                server_url = self._streams_context.url
-                await self.cleanup()
-                await self.connect_to_sse_server(server_url)
-            else:
-                print("Unable to automatically reconnect. Please restart the client.")
-                return "Connection to server lost. Please restart the client."
-            
-            # Try again after reconnection
-            try:
-                response = await self.session.list_tools()
-            except Exception as e:
-                return f"Failed to reconnect to server: {str(e)}"
+            cached = json_compat.loads(await asyncio.to_thread(self._tools_cache_path.read_bytes))
+            if cached["version"] == server_version:
+                self._tools_cache = cached["tools"]
+                return
+        except (OSError, KeyError, TypeError, *json_compat.JSONDecodeError):
+            pass
 
-        available_tools = [{ 
+        print("Listing tools...")
+        response = await self.session.list_tools()
+        await self._cache_tools(response.tools)
+
+    async def _cache_tools(self, tools):
+        """Convert MCP tools to OpenAI tool definitions and keep them for later queries"""
+        self._tools_cache = [{
             "type": "function",
             "function": {
                 "name": tool.name,
                 "description": tool.description,
                 "parameters": tool.inputSchema
             }
-        } for tool in response.tools]
+        } for tool in tools]
+
+        # Persist them for the next run, off the event loop since the write fsyncs;
+        # a failed write only costs a list_tools call later
+        if self._tools_cache_path is not None:
+            try:
+                await asyncio.to_thread(self._write_tools_cache, json_compat.dumps({
+                    "version": self._server_version,
+                    "tools": self._tools_cache
+                }))
+            except OSError as e:
+                print(f"Could not write tools cache: {str(e)}")
+
+    def _write_tools_cache(self, data: bytes):
+        """Atomically write serialized tool definitions to the cache file"""
+        self._tools_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        AtomicWriter(self._tools_cache_path).write(data)
+
+    def _invalidate_tools(self):
+        """Drop the cached tools so the next query re-fetches them from the server"""
+        self._tools_cache = None
+
+    async def cleanup(self):
+        """Close the session and transport in reverse order of opening"""
+        self.session = None
+        await self.exit_stack.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.cleanup()
+
+    async def _call_tool(self, tool_call):
+        """Execute a single tool call, returning a printable form of its arguments and the result"""
+        tool_name = tool_call["function"]["name"]
+        tool_args = json_compat.loads(tool_call["function"]["arguments"])
+
+        # The arguments are only serialized for display, so skip it when nobody is watching
+        args_repr = msgspec.json.encode(tool_args).decode() if sys.stdout.isatty() else ""
+
+        # Execute tool call
+        print(f"Calling tool: {tool_name} with args: {args_repr}")
+        result = await self.session.call_tool(tool_name, tool_args)
+        return args_repr, result
+
+    async def process_query(self, query: str) -> AsyncIterator[str]:
+        """Process a query using OpenAI and available tools, yielding output as it arrives"""
+        messages: list[Msg] = [Msg(role="user", content=query)]
+
+        # Tools are cached at connect time; only re-fetch after a list_changed
+        # notification or a lost connection invalidated the cache
+        if self._tools_cache is None:
+            try:
+                response = await self.session.list_tools()
+                await self._cache_tools(response.tools)
+            except anyio.BrokenResourceError:
+                print("Connection to server lost. Attempting to reconnect...")
+                if self._reconnect is None:
+                    print("Unable to automatically reconnect. Please restart the client.")
+                    yield "Connection to server lost. Please restart the client."
+                    return
+                
+                # Reconnecting also reloads the tools
+                try:
+                    await self.cleanup()
+                    await self._reconnect()
+                except Exception as e:
+                    yield f"Failed to reconnect to server: {str(e)}"
+                    return
+
+        available_tools = self._tools_cache
 
         # Initial OpenAI API call
         try:
-            response = self.openai.chat.completions.create(
+            response = await self.openai.chat.completions.create(
                 model=self.model,
-                messages=messages,
+                messages=msgspec.to_builtins(messages),
                 tools=available_tools,
-                tool_choice="auto"
+                tool_choice="auto",
+                stream=True
             )
 
-            # Process response and handle tool calls
-            tool_results = []
-            final_text = []
-
-            message = response.choices[0].message
-            final_text.append(message.content or "")
+            # Stream the text as it arrives while assembling tool calls from their deltas
+            tool_calls = {}
+            content_parts = []
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield delta.content
+                for tool_call_delta in delta.tool_calls or []:
+                    tool_call = tool_calls.setdefault(tool_call_delta.index, {
+                        "id": None,
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""}
+                    })
+                    if tool_call_delta.id:
+                        tool_call["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        tool_call["function"]["name"] += tool_call_delta.function.name or ""
+                        tool_call["function"]["arguments"] += tool_call_delta.function.arguments or ""
             
             # Check if the model wants to call a tool
-            if message.tool_calls:
-                for tool_call in message.tool_calls:
-                    tool_name = tool_call.function.name
-                    try:
-                        tool_args = json.loads(tool_call.function.arguments)
-                        
-                        # Execute tool call
-                        print(f"Calling tool: {tool_name} with args: {json.dumps(tool_args)}")
-                        result = await self.session.call_tool(tool_name, tool_args)
-                        
-                        # Extract the content as a string from the result object
-                        if hasattr(result, 'content'):
-                            result_content = str(result.content)
-                        else:
-                            result_content = str(result)
-                            
-                        tool_results.append({"call": tool_name, "result": result_content})
-                        final_text.append(f"[Calling tool {tool_name} with args {json.dumps(tool_args)}]")
-
-                        # Add assistant's response with tool call to the messages
-                        messages.append({
-                            "role": "assistant",
-                            "content": None,  # OpenAI requires content to be null when tool_calls is present
-                            "tool_calls": [
-                                {
-                                    "id": tool_call.id,
-                                    "type": "function",
-                                    "function": {
-                                        "name": tool_call.function.name,
-                                        "arguments": tool_call.function.arguments
-                                    }
-                                }
-                            ]
-                        })
-                        
-                        # Add the tool response to messages - Make sure it's a simple string
-                        messages.append({
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": result_content  # This must be a string, not an object
-                        })
-
-                        # Get next response from OpenAI
-                        response = self.openai.chat.completions.create(
-                            model=self.model,
-                            messages=messages
-                        )
-                        
-                        final_text.append(response.choices[0].message.content)
-                    except Exception as e:
-                        error_msg = f"Error executing tool {tool_name}: {str(e)}"
+            if tool_calls:
+                tool_calls = [tool_calls[index] for index in sorted(tool_calls)]
+
+                # Run the tool calls concurrently; failures are returned rather than raised
+                results = await asyncio.gather(
+                    *(self._call_tool(tool_call) for tool_call in tool_calls),
+                    return_exceptions=True
+                )
+
+                # Add assistant's response with all tool calls to the messages
+                # Keep any text streamed before the tool calls so the follow-up sees it too
+                messages.append(Msg(role="assistant", content="".join(content_parts) or None, tool_calls=tool_calls))
+
+                for tool_call, outcome in zip(tool_calls, results):
+                    tool_name = tool_call["function"]["name"]
+                    if isinstance(outcome, asyncio.CancelledError):
+                        # A cancelled tool call means the query itself is being cancelled
+                        raise outcome
+                    if isinstance(outcome, BaseException):
+                        if isinstance(outcome, anyio.BrokenResourceError):
+                            # Force a tools re-fetch (and reconnect) on the next query
+                            self._invalidate_tools()
+                        error_msg = f"Error executing tool {tool_name}: {str(outcome)}"
                         print(error_msg)
-                        final_text.append(error_msg)
-                        # Continue with OpenAI to get a response even if tool call failed
-                        messages.append({
-                            "role": "system",
-                            "content": f"There was an error calling the {tool_name} tool: {str(e)}. Please respond without using the tool."
-                        })
-                        response = self.openai.chat.completions.create(
-                            model=self.model,
-                            messages=messages
-                        )
-                        final_text.append(response.choices[0].message.content)
-                
-            return "\n".join(final_text)
+                        yield "\n" + error_msg
+                        # Every tool call needs a response, so report the error in its place
+                        result_content = f"There was an error calling the {tool_name} tool: {str(outcome)}. Please respond without using the tool."
+                    else:
+                        args_repr, result = outcome
+
+                        # Send only the text of the result, not the repr of its content objects
+                        result_content = _flatten_content(result)
+
+                        yield f"\n[Calling tool {tool_name} with args {args_repr}]"
+
+                    # Add the tool response to messages - Make sure it's a simple string
+                    # This must be a string, not an object
+                    messages.append(Msg(role="tool", content=result_content, tool_call_id=tool_call["id"]))
+
+                # Get a single follow-up response covering all tool results
+                response = await self.openai.chat.completions.create(
+                    model=self.model,
+                    messages=msgspec.to_builtins(messages),
+                    stream=True
+                )
+
+                yield "\n"
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
         except Exception as e:
             import traceback
             traceback.print_exc()
-            return f"An error occurred: {str(e)}"
+            yield f"An error occurred: {str(e)}"
     
 
     async def chat_loop(self):
@@ -215,15 +319,18 @@ class MCPClient:
         
         while True:
             try:
-                query = input("\nQuery: ").strip()
+                query = (await asyncio.to_thread(input, "\nQuery: ")).strip()
                 
                 if query.lower() == 'quit':
                     break
                 elif not query:
                     continue
                     
-                response = await self.process_query(query)
-                print("\n" + response)
+                print()
+                async for piece in self.process_query(query):
+                    sys.stdout.write(piece)
+                    sys.stdout.flush()
+                print()
                     
             except Exception as e:
                 print(f"\nError: {str(e)}")
@@ -232,76 +339,73 @@ class MCPClient:
 
 
 async def main():
-    # Initialize empty servers dictionary
-    servers = {}
-    server_types = {}
-    
-    # Load configuration from sse_servers.json
-    try:
-        with open('sse_servers.json', 'r') as f:
-            sse_config = json.load(f)
-            sse_servers = sse_config.get('mcpServers', {})
-            for name, server in sse_servers.items():
-                servers[name] = server
-                server_types[name] = "sse"
-        print("Loaded SSE servers configuration.")
-    except FileNotFoundError:
-        print("sse_servers.json not found, continuing without SSE servers.")
-    except json.JSONDecodeError:
-        print("Error parsing sse_servers.json, continuing without SSE servers.")
-    
-    # Load configuration from npx_servers.json
-    try:
-        with open('npx_servers.json', 'r') as f:
-            npx_config = json.load(f)
-            npx_servers = npx_config.get('mcpServers', {})
-            for name, server in npx_servers.items():
-                servers[name] = server
-                server_types[name] = "npx"
-        print("Loaded NPX servers configuration.")
-    except FileNotFoundError:
-        print("npx_servers.json not found, continuing without NPX servers.")
-    except json.JSONDecodeError:
-        print("Error parsing npx_servers.json, continuing without NPX servers.")
-        
-    # Load configuration from uv_servers.json
+    # Server registry as parallel lists: names[i], configs[i] and kinds[i] describe one server
+    names = []
+    configs = []
+    kinds = []
+    positions = {}  # name -> index, only needed while loading to apply later lines
+
+    # Fold any legacy JSON config files into servers.jsonl on first run
+    migrate_legacy_configs()
+
+    # Load configuration from servers.jsonl, one server entry per line
+    line_count = 0
+    parse_errors = 0
     try:
-        with open('uv_servers.json', 'r') as f:
-            uv_config = json.load(f)
-            uv_servers = uv_config.get('mcpServers', {})
-            for name, server in uv_servers.items():
-                servers[name] = server
-                server_types[name] = "uv"
-        print("Loaded UV servers configuration.")
+        with open(CONFIG_PATH, 'rb') as f:
+            for line in f:
+                line_count += 1
+                if not line.strip():
+                    continue
+                try:
+                    entry = json_compat.loads(line)
+                except json_compat.JSONDecodeError:
+                    entry = None
+                if is_header(entry):
+                    continue
+                if not is_server_entry(entry):
+                    # Skip only the broken line so the servers after it still load
+                    parse_errors += 1
+                    print(f"Error parsing line {line_count} of {CONFIG_PATH}, skipping it.")
+                    continue
+                position = positions.get(entry["name"])
+                if position is None:
+                    positions[entry["name"]] = len(names)
+                    names.append(entry["name"])
+                    configs.append(entry["config"])
+                    kinds.append(entry["transport"])
+                else:
+                    configs[position] = entry["config"]
+                    kinds[position] = entry["transport"]
+        print("Loaded servers configuration.")
     except FileNotFoundError:
-        print("uv_servers.json not found, continuing without UV servers.")
-    except json.JSONDecodeError:
-        print("Error parsing uv_servers.json, continuing without UV servers.")
+        print(f"{CONFIG_PATH} not found.")
+
+    # Drop superseded entries once enough of them have piled up; leave a file
+    # with broken lines alone so compaction doesn't discard what the user wrote
+    if not parse_errors and line_count > COMPACT_THRESHOLD and line_count - 1 > len(names):
+        compact()
     
     # Check if we have any servers
-    if not servers:
-        print("No MCP servers found in configuration files.")
+    if not names:
+        print("No MCP servers found in configuration file.")
         return
     
     # Print available servers
     print("\nAvailable MCP servers:")
-    for i, name in enumerate(servers.keys(), 1):
-        server_type = server_types[name]
-        print(f"{i}. {name} ({server_type.upper()})")
+    for i, (name, kind) in enumerate(zip(names, kinds), 1):
+        print(f"{i}. {name} ({kind.upper()})")
     
     # Ask user to select a server
     selection = input("\nSelect a server (number): ")
     try:
         index = int(selection) - 1
-        selected_server = list(servers.keys())[index]
-        server_config = servers[selected_server]
-        server_type = server_types[selected_server]
+        selected_server, server_config, server_type = names[index], configs[index], kinds[index]
     except (ValueError, IndexError):
         print("Invalid selection. Exiting.")
         return
     
-    client = MCPClient()
-    try:
+    async with MCPClient() as client:
         if server_type == "sse":
             server_url = server_config['url']
             print(f"Using SSE server: {selected_server} ({server_url})")
@@ -313,10 +417,7 @@ async def main():
             await client.connect_to_stdio_server(command=command, args=args)
         
         await client.chat_loop()
-    finally:
-        await client.cleanup()
 
 
 if __name__ == "__main__":
-    import sys
     asyncio.run(main())
\ No newline at end of file